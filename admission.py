@@ -0,0 +1,163 @@
+# LeetCode Streak Checker - Webhook Admission Control
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+from streak_check import match_command
+
+logger = logging.getLogger(__name__)
+
+# Global token bucket: sustained updates/second and burst size across all chats
+GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "20"))
+GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "40"))
+
+# Per-chat token bucket: one chat spamming commands cannot take the whole budget
+CHAT_RATE = float(os.getenv("ADMISSION_CHAT_RATE", "0.5"))
+CHAT_BURST = float(os.getenv("ADMISSION_CHAT_BURST", "5"))
+
+# Concurrency caps; the global cap leaves workers and API capacity for the scheduled sweep
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+MAX_IN_FLIGHT_PER_CHAT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT_PER_CHAT", "2"))
+
+# Idle per-chat state is dropped once this many chats are tracked
+MAX_TRACKED_CHATS = 10000
+
+# Commands whose repeats from the same chat are folded into the pending evaluation
+COALESCED_COMMANDS = ("/check",)
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens/second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+class AdmissionController:
+    """Decides whether a webhook update is processed now or shed, and counts sheds by reason."""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST,
+                 max_in_flight: int = MAX_IN_FLIGHT, max_in_flight_per_chat: int = MAX_IN_FLIGHT_PER_CHAT):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_chat = max_in_flight_per_chat
+        self._lock = threading.Lock()
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._chat_in_flight: Dict[str, int] = defaultdict(int)
+        self._pending_checks: set = set()
+        self._in_flight = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = defaultdict(int)
+
+    def try_admit(self, chat_id: Optional[str], command: Optional[str]) -> Optional[str]:
+        """Admit an update, or return the reason it was shed.
+
+        Every admitted update must be followed by release() with the same arguments."""
+        with self._lock:
+            now = time.monotonic()
+            reason = self._shed_reason(chat_id, command, now)
+            if reason:
+                self.shed[reason] += 1
+                return reason
+
+            self._global_bucket.take()
+            self._in_flight += 1
+            if chat_id is not None:
+                self._chat_buckets[chat_id].take()
+                self._chat_in_flight[chat_id] += 1
+                if command in COALESCED_COMMANDS:
+                    self._pending_checks.add(chat_id)
+            self.admitted += 1
+            return None
+
+    def _shed_reason(self, chat_id: Optional[str], command: Optional[str], now: float) -> Optional[str]:
+        if chat_id is not None and command in COALESCED_COMMANDS and chat_id in self._pending_checks:
+            return "coalesced"
+        if self._in_flight >= self.max_in_flight:
+            return "global_in_flight"
+        if chat_id is not None:
+            if self._chat_in_flight.get(chat_id, 0) >= self.max_in_flight_per_chat:
+                return "chat_in_flight"
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                self._prune(now)
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+                bucket.updated = now
+            if bucket.refill(now) < 1:
+                return "chat_rate"
+        if self._global_bucket.refill(now) < 1:
+            return "global_rate"
+        return None
+
+    def release(self, chat_id: Optional[str], command: Optional[str]) -> None:
+        """Mark an admitted update as finished."""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if chat_id is None:
+                return
+            self._chat_in_flight[chat_id] -= 1
+            if self._chat_in_flight[chat_id] <= 0:
+                del self._chat_in_flight[chat_id]
+            if command in COALESCED_COMMANDS:
+                self._pending_checks.discard(chat_id)
+
+    def _prune(self, now: float) -> None:
+        """Forget idle chats whose buckets have fully refilled."""
+        if len(self._chat_buckets) < MAX_TRACKED_CHATS:
+            return
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in self._chat_in_flight and bucket.refill(now) >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    def stats(self) -> dict:
+        """Counters for monitoring endpoints."""
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "shed_total": sum(self.shed.values()),
+                "in_flight": self._in_flight,
+                "pending_checks": len(self._pending_checks),
+                "tracked_chats": len(self._chat_buckets),
+                "limits": {
+                    "global_rate": self._global_bucket.rate,
+                    "global_burst": self._global_bucket.capacity,
+                    "chat_rate": self.chat_rate,
+                    "chat_burst": self.chat_burst,
+                    "max_in_flight": self.max_in_flight,
+                    "max_in_flight_per_chat": self.max_in_flight_per_chat
+                }
+            }
+
+def describe_update(update: dict) -> Tuple[Optional[str], Optional[str]]:
+    """Extract (chat_id, command) from a Telegram update, e.g. ("123", "/check").
+
+    Uses the same prefix matching as handle_message, so "/checkx" counts as "/check"."""
+    message = update.get("message")
+    if not isinstance(message, dict):
+        return None, None
+    chat = message.get("chat")
+    chat_id = chat.get("id") if isinstance(chat, dict) else None
+    text = message.get("text")
+    text = text.strip() if isinstance(text, str) else ""
+    command = None
+    if text.startswith("/"):
+        command = match_command(text) or text.split()[0]
+    return (str(chat_id) if chat_id is not None else None), command
+
+# Shared controller for the /webhook route
+controller = AdmissionController()
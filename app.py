@@ -1,5 +1,6 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory
 import os
+import hmac
 import logging
 import threading
 import time
@@ -7,7 +8,10 @@ import schedule
 from datetime import datetime, time as dtime
 from typing import List
 from zoneinfo import ZoneInfo
-from streak_check import handle_webhook, set_webhook, check_all_users, get_user_leetcode, users
+from streak_check import handle_webhook, set_webhook, check_all_users, get_user_leetcode, users, sweep_history
+from recorder import record_update, RECORD_UPDATES_FILE
+import profiling
+import admission
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +34,16 @@ UTC = ZoneInfo("UTC")
 # Defaults: 09:00, 13:30, 18:00, 20:00 (IST)
 CHECK_TIMES_IST = os.getenv("CHECK_TIMES_IST", "09:00,13:30,18:00,20:00")
 
+# Token required in the X-Admin-Token header for admin endpoints (disabled if unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def is_admin_request() -> bool:
+    """Check the request carries the configured admin token."""
+    if not ADMIN_TOKEN:
+        return False
+    # Compare bytes: compare_digest raises TypeError on non-ASCII str
+    return hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode())
+
 def _parse_hhmm(value: str) -> tuple[int, int]:
     parts = value.strip().split(":")
     if len(parts) != 2:
@@ -68,8 +82,8 @@ def scheduled_streak_check():
     try:
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         logger.info(f"🕐 Running scheduled streak check at {current_time}")
-        check_all_users()
-        logger.info("✅ Scheduled streak check completed")
+        summary = check_all_users()
+        logger.info(f"✅ Scheduled streak check completed in {summary['duration_seconds']}s, phases: {summary['phases_seconds']}")
     except Exception as e:
         logger.error(f"❌ Error in scheduled check: {e}")
 
@@ -120,16 +134,19 @@ def home():
         "features": {
             "automatic_daily_checks_ist": [p['ist'] for p in get_scheduled_times_pairs()],
             "manual_commands": "Available via Telegram",
-            "webhook_support": "Real-time responses"
+            "webhook_support": "Real-time responses",
+            "update_recording": bool(RECORD_UPDATES_FILE)
         },
         "endpoints": {
             "/": "GET - API information and health check",
             "/webhook": "POST - Handle Telegram webhook",
             "/set_webhook": "POST - Set webhook URL",
             "/health": "GET - Health check endpoint",
-            "/stats": "GET - Bot statistics",
+            "/stats": "GET - Bot statistics and webhook shed counts",
             "/manual_check": "POST - Manually trigger check for all users",
-            "/users": "GET - Detailed user information"
+            "/users": "GET - Detailed user information",
+            "/profiling": "GET/POST - List profiles and sweep timings / arm profiling (admin)",
+            "/profiling/<name>": "GET - Download a stored profile (admin)"
         },
         "status": "running",
         "scheduler": "active",
@@ -178,6 +195,8 @@ def get_stats():
             "next_scheduled_check_utc": next_run,
             "next_scheduled_check_ist": (schedule.next_run().replace(tzinfo=UTC).astimezone(IST).strftime('%Y-%m-%d %H:%M:%S IST') if schedule.jobs else "No scheduled jobs"),
             "daily_check_times_ist": [p['ist'] for p in get_scheduled_times_pairs()],
+            "last_sweep": sweep_history[-1] if sweep_history else None,
+            "webhook_admission": admission.controller.stats(),
             "bot_uptime": datetime.now().isoformat(),
             "status": "active"
         }), 200
@@ -199,7 +218,21 @@ def webhook():
             update_id = data.get('update_id', 'unknown')
             logger.info(f"Processing webhook update_id: {update_id}")
             
-            handle_webhook(data)
+            # Capture anonymized update for later replay (no-op unless RECORD_UPDATES_FILE is set)
+            record_update(data)
+            
+            # Shed bursts before doing any LeetCode/Telegram work. Shed updates still get a 200
+            # so Telegram does not redeliver them.
+            chat_id, command = admission.describe_update(data)
+            shed_reason = admission.controller.try_admit(chat_id, command)
+            if shed_reason:
+                logger.info(f"Shed webhook update_id {update_id} from chat {chat_id}: {shed_reason}")
+                return jsonify({"status": "shed", "reason": shed_reason}), 200
+            
+            try:
+                handle_webhook(data)
+            finally:
+                admission.controller.release(chat_id, command)
             return jsonify({"status": "success"}), 200
         except Exception as e:
             logger.error(f"Webhook handling error: {e}")
@@ -239,11 +272,12 @@ def manual_check():
     """Manually trigger streak check for all users."""
     try:
         logger.info("Manual check triggered via API")
-        check_all_users()
+        summary = check_all_users()
         return jsonify({
             "status": "success", 
-            "message": f"Manual check completed for {len(users)} users",
-            "users_checked": len(users),
+            "message": f"Manual check completed for {summary['users_checked']} users",
+            "users_checked": summary['users_checked'],
+            "sweep": summary,
             "timestamp": datetime.now().isoformat()
         }), 200
     except Exception as e:
@@ -316,6 +350,43 @@ def get_users():
         logger.error(f"Users endpoint error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/profiling', methods=['GET', 'POST'])
+def profiling_control():
+    """Arm profiling for upcoming sweeps/messages, or list stored profiles and sweep timings."""
+    if not is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required"}), 403
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"status": "error", "message": "JSON object body required"}), 400
+            target = data.get('target')
+            try:
+                count = int(data.get('count', 1))
+                profiling.arm(target, count)
+            except (TypeError, ValueError, AttributeError) as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            logger.info(f"Profiling armed via API: {count} x {target}")
+
+        return jsonify({
+            "armed": profiling.armed(),
+            "profiles": profiling.list_profiles(),
+            "recent_sweeps": list(sweep_history),
+            "timestamp": datetime.now().isoformat()
+        }), 200
+    except Exception as e:
+        logger.error(f"Profiling endpoint error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/profiling/<name>')
+def download_profile(name):
+    """Download a stored cProfile file (load with pstats or snakeviz)."""
+    if not is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required"}), 403
+    if not name.endswith('.prof'):
+        return jsonify({"status": "error", "message": "Profile not found"}), 404
+    return send_from_directory(os.path.abspath(profiling.PROFILE_DIR), name, as_attachment=True)
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors."""
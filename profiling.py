@@ -0,0 +1,145 @@
+# LeetCode Streak Checker - On-demand Profiling & Phase Timing
+import os
+import time
+import cProfile
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory where .prof files are written and served from
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Oldest profiles beyond this count are deleted
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Upper bound for a single arm request
+MAX_PROFILE_COUNT = 100
+
+# Profiling targets: "sweep" = check_all_users runs, "message" = handle_message calls
+TARGETS = ("sweep", "message")
+
+_lock = threading.Lock()
+# Runs can also be armed at startup, e.g. PROFILE_NEXT_SWEEPS=3
+_armed: Dict[str, int] = {
+    "sweep": min(int(os.getenv("PROFILE_NEXT_SWEEPS", "0")), MAX_PROFILE_COUNT),
+    "message": min(int(os.getenv("PROFILE_NEXT_MESSAGES", "0")), MAX_PROFILE_COUNT)
+}
+_spans = threading.local()
+
+def arm(target: str, count: int) -> int:
+    """Profile the next `count` runs of `target`. Returns the number now armed."""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown profiling target '{target}', expected one of {', '.join(TARGETS)}")
+    if not 0 <= count <= MAX_PROFILE_COUNT:
+        raise ValueError(f"count must be between 0 and {MAX_PROFILE_COUNT}")
+    with _lock:
+        _armed[target] = count
+    logger.info(f"Profiling armed for next {count} {target} run(s)")
+    return count
+
+def armed() -> Dict[str, int]:
+    """Return remaining profiled runs per target."""
+    with _lock:
+        return dict(_armed)
+
+def _take(target: str) -> bool:
+    with _lock:
+        if _armed.get(target, 0) <= 0:
+            return False
+        _armed[target] -= 1
+        return True
+
+def _give_back(target: str) -> None:
+    with _lock:
+        _armed[target] += 1
+
+def _prune() -> None:
+    profiles = list_profiles()
+    for entry in profiles[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry["name"]))
+        except OSError as e:
+            logger.warning(f"Could not remove old profile {entry['name']}: {e}")
+
+@contextmanager
+def maybe_profile(target: str):
+    """Run the block under cProfile if `target` is armed.
+
+    Yields a dict; after the block, its "file" key holds the profile name (if one was written)."""
+    info: Dict[str, Optional[str]] = {"file": None}
+    if not _take(target):
+        yield info
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiler is already active (e.g. a concurrent profiled call); retry next run
+        logger.warning(f"Could not start {target} profiler: {e}")
+        _give_back(target)
+        yield info
+        return
+
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{target}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+            info["file"] = name
+            logger.info(f"📈 Saved {target} profile {name}")
+            _prune()
+        except Exception as e:
+            logger.error(f"Error saving {target} profile: {e}")
+
+def list_profiles() -> List[dict]:
+    """List stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".prof"):
+            continue
+        try:
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            # Removed by a concurrent prune since listdir
+            continue
+        profiles.append({
+            "name": name,
+            "size_bytes": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+        })
+    profiles.sort(key=lambda p: p["created_at"], reverse=True)
+    return profiles
+
+@contextmanager
+def collect_spans():
+    """Accumulate span() timings in this thread; yields the phase -> seconds dict."""
+    previous = getattr(_spans, "current", None)
+    _spans.current = defaultdict(float)
+    try:
+        yield _spans.current
+    finally:
+        _spans.current = previous
+
+@contextmanager
+def span(phase: str):
+    """Time a block as `phase` if a collect_spans() is active in this thread."""
+    current = getattr(_spans, "current", None)
+    if current is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current[phase] += time.perf_counter() - started
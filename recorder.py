@@ -0,0 +1,125 @@
+# LeetCode Streak Checker - Webhook Update Recorder
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Recording is off unless RECORD_UPDATES_FILE is set
+RECORD_UPDATES_FILE = os.getenv("RECORD_UPDATES_FILE")
+
+# Salt for chat identifier pseudonyms. Keep it fixed across restarts if the
+# same chat should map to the same pseudonym in one recording.
+RECORD_SALT = os.getenv("RECORD_SALT") or os.urandom(16).hex()
+
+_lock = threading.Lock()
+
+def _pseudonym(value) -> int:
+    """Map an identifier to a stable, non-reversible positive integer."""
+    digest = hashlib.sha256(f"{RECORD_SALT}:{value}".encode()).hexdigest()
+    return int(digest[:12], 16)
+
+# Fields kept from user/chat objects (any dict with an integer "id"); everything else is dropped
+IDENTITY_FIELDS = ("id", "username", "is_bot", "type")
+
+# Keys dropped wherever they appear since they carry personal data
+DROPPED_KEYS = {"contact", "location", "venue", "phone_number", "author_signature"}
+
+# Suffixes of string fields that hold names (first_name, sender_user_name, ...), titles or bios
+DROPPED_SUFFIXES = ("name", "title", "bio")
+
+def _is_id_key(key: str) -> bool:
+    """True for raw identifier fields such as chat_id, migrate_to_chat_id or user_ids."""
+    return key in ("chat_id", "user_id", "user_ids") or key.endswith(("_chat_id", "_user_id", "_user_ids"))
+
+def _pseudonymize_ids(value):
+    if isinstance(value, list):
+        return [_pseudonymize_ids(item) for item in value]
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        return _pseudonym(value)
+    return value
+
+def _anonymize_identity(obj: dict) -> dict:
+    """Reduce a user/chat object to pseudonymized id/username plus non-identifying fields."""
+    kept = {}
+    for key in IDENTITY_FIELDS:
+        if key not in obj:
+            continue
+        if key == "id":
+            kept["id"] = _pseudonym(obj["id"])
+        elif key == "username":
+            kept["username"] = f"user{_pseudonym(obj['username'])}"
+        else:
+            kept[key] = obj[key]
+    return kept
+
+def _anonymize(value):
+    if isinstance(value, list):
+        return [_anonymize(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    # Users and chats have integer ids; string ids belong to callback/inline queries and polls
+    if isinstance(value.get("id"), int) and not isinstance(value.get("id"), bool):
+        return _anonymize_identity(value)
+    result = {}
+    for key, item in value.items():
+        if key in DROPPED_KEYS:
+            continue
+        if isinstance(item, str) and key.endswith(DROPPED_SUFFIXES):
+            continue
+        if _is_id_key(key):
+            result[key] = _pseudonymize_ids(item)
+        elif key == "username" and isinstance(item, str):
+            result[key] = f"user{_pseudonym(item)}"
+        else:
+            result[key] = _anonymize(item)
+    return result
+
+def anonymize_update(update: dict) -> dict:
+    """Return a copy of a Telegram update with every chat and user identifier replaced.
+
+    The whole update is walked: every user/chat object is cut down to IDENTITY_FIELDS,
+    every *chat_id / *user_id(s) value is pseudonymized and name/title/bio strings are
+    dropped. Message text is kept so replayed commands behave the same way."""
+    return _anonymize(update)
+
+def record_update(update: dict, path: Optional[str] = None) -> None:
+    """Append an anonymized update to the recording file, if recording is enabled.
+
+    Each line is a compact JSON object: {"t": unix receive time, "u": update}."""
+    path = path or RECORD_UPDATES_FILE
+    if not path:
+        return
+    try:
+        line = json.dumps(
+            {"t": round(time.time(), 3), "u": anonymize_update(update)},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        with _lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except Exception as e:
+        logger.error(f"Error recording update: {e}")
+
+def load_recording(path: str) -> list:
+    """Load recorded (timestamp, update) pairs, sorted by timestamp."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry.get("u"), dict):
+                    raise ValueError("update is not a JSON object")
+                entries.append((float(entry["t"]), entry["u"]))
+            except Exception as e:
+                logger.warning(f"Skipping malformed recording line {line_no}: {e}")
+    entries.sort(key=lambda e: e[0])
+    return entries
@@ -0,0 +1,283 @@
+# LeetCode Streak Checker - Webhook Replay Load Generator
+"""Replay recorded webhook updates against a local bot instance.
+
+Usage:
+    python replay.py updates.jsonl --speed 10
+
+By default this starts stand-in LeetCode and Telegram servers, launches app.py
+against them with a throwaway users file, fires the recorded updates at
+/webhook at the requested speed and prints latency percentiles and error rates
+per command. Use --target to hit an already running instance instead; that
+instance must be started with LEETCODE_GRAPHQL_URL / TELEGRAM_API_BASE pointing
+at stand-in servers if it should not reach the real APIs.
+"""
+import os
+import sys
+import math
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from recorder import load_recording
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Stand-in for the LeetCode GraphQL API and the Telegram Bot API."""
+
+    latency = 0.0
+    counts: Dict[str, int] = defaultdict(int)
+    counts_lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.path.endswith("/graphql"):
+            kind = "leetcode"
+            try:
+                query = json.loads(body or b"{}").get("query", "")
+            except ValueError:
+                query = ""
+            if "matchedUser" in query:
+                payload = {"data": {"matchedUser": {"username": "replay", "profile": {"realName": ""}}}}
+            else:
+                payload = {"data": {"recentSubmissionList": [
+                    {"timestamp": str(int(time.time())), "statusDisplay": "Accepted",
+                     "title": "Two Sum", "lang": "python3"}
+                ]}}
+        else:
+            kind = "telegram"
+            payload = {"ok": True, "result": {}}
+
+        with self.counts_lock:
+            self.counts[kind] += 1
+
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(latency_ms: float) -> ThreadingHTTPServer:
+    """Start the stand-in API server on a free local port."""
+    StubHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def seed_users_file(path: str, entries: List[Tuple[float, dict]]) -> int:
+    """Register every recorded chat that never sends /register, so /check does real work."""
+    chats, registering = set(), set()
+    for _, update in entries:
+        message = update.get("message") or {}
+        chat_id = (message.get("chat") or {}).get("id")
+        if chat_id is None:
+            continue
+        chats.add(str(chat_id))
+        if (message.get("text") or "").strip().startswith("/register"):
+            registering.add(str(chat_id))
+    seeded = {chat_id: f"replay_{i}" for i, chat_id in enumerate(sorted(chats - registering))}
+    with open(path, "w") as f:
+        json.dump(seeded, f)
+    return len(seeded)
+
+def _tail(path: str, lines: int = 20) -> str:
+    try:
+        with open(path, "r", errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+    except OSError:
+        return ""
+
+def launch_app(port: int, stub_url: str, workdir: str, log_path: str) -> subprocess.Popen:
+    """Launch app.py against the stand-in servers and wait until /health answers.
+
+    The app's stdout/stderr go to `log_path`, which should live outside `workdir`
+    so it survives a failed launch."""
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": "replay",
+        "TELEGRAM_API_BASE": stub_url,
+        "LEETCODE_GRAPHQL_URL": f"{stub_url}/graphql",
+        "USERS_FILE": os.path.join(workdir, "users.json"),
+        "PORT": str(port),
+        "DEBUG": "False",
+    })
+    # Never re-record replayed traffic
+    env.pop("RECORD_UPDATES_FILE", None)
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, APP_PATH], env=env, cwd=workdir,
+                                stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app.py exited with code {proc.returncode} (full log: {log_path}):\n"
+                               f"{_tail(log_path)}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"app.py did not become healthy within 30 seconds (full log: {log_path}):\n"
+                       f"{_tail(log_path)}")
+
+def command_of(update: dict) -> str:
+    """Classify an update by its bot command (e.g. '/check')."""
+    message = update.get("message")
+    if not isinstance(message, dict):
+        return "non-message"
+    text = (message.get("text") or "").strip()
+    if not text.startswith("/"):
+        return "text"
+    return text.split()[0].split("@")[0].lower()
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def replay(entries: List[Tuple[float, dict]], target: str, speed: float, max_gap: float,
+           workers: int, timeout: float) -> Tuple[Dict[str, dict], float]:
+    """Fire updates at target preserving (compressed) inter-arrival times.
+
+    Latency is measured from when each update was handed to the worker pool, so
+    queueing behind a backed-up pool is included. Returns per-command results and
+    the worst dispatch lag in seconds."""
+    results: Dict[str, dict] = defaultdict(lambda: {"latencies": [], "shed_latencies": [], "errors": 0})
+    results_lock = threading.Lock()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    webhook_url = f"{target.rstrip('/')}/webhook"
+
+    def fire(update: dict, started: float) -> None:
+        # `started` is the scheduled/submit time, so time queued in the pool counts as latency
+        command = command_of(update)
+        shed = False
+        try:
+            response = session.post(webhook_url, json=update, timeout=timeout)
+            ok = response.status_code == 200
+            shed = ok and response.json().get("status") == "shed"
+        except Exception:
+            # Anything unexpected (connection errors, non-JSON or non-object bodies) counts as an error
+            ok, shed = False, False
+        elapsed = time.perf_counter() - started
+        with results_lock:
+            # Shed acks return almost immediately; keep them out of the admitted percentiles
+            results[command]["shed_latencies" if shed else "latencies"].append(elapsed)
+            if not ok:
+                results[command]["errors"] += 1
+
+    max_lag = 0.0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        offset, previous = 0.0, None
+        for timestamp, update in entries:
+            if previous is not None:
+                offset += min(max(timestamp - previous, 0.0), max_gap)
+            previous = timestamp
+            due = start + offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            pool.submit(fire, update, max(due, time.perf_counter()))
+    return results, max_lag
+
+def print_report(results: Dict[str, dict], wall: float, max_lag: float) -> None:
+    """Print latency percentiles of admitted updates, error rates and shed counts per command."""
+    print(f"\n{'command':<14}{'count':>7}{'errors':>8}{'err%':>7}{'shed':>7}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}")
+    total, total_errors, total_shed = 0, 0, 0
+    for command in sorted(results):
+        latencies = sorted(results[command]["latencies"])
+        errors = results[command]["errors"]
+        shed = len(results[command]["shed_latencies"])
+        count = len(latencies) + shed
+        total += count
+        total_errors += errors
+        total_shed += shed
+        print(f"{command:<14}{count:>7}{errors:>8}{100.0 * errors / count:>6.1f}%{shed:>7}"
+              f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+              f"{percentile(latencies, 99) * 1000:>9.1f}{(latencies[-1] if latencies else 0.0) * 1000:>9.1f}")
+    if total:
+        print(f"\n{total} updates in {wall:.1f}s ({total / wall:.1f}/s), "
+              f"error rate {100.0 * total_errors / total:.1f}%, shed {total_shed}, "
+              f"max dispatch lag {max_lag * 1000:.0f}ms (latency columns cover admitted updates only)")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded webhook updates against a local bot instance.")
+    parser.add_argument("recording", help="File written by the recorder (RECORD_UPDATES_FILE)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, 1-100 (default: 1)")
+    parser.add_argument("--target", help="Base URL of a running instance (default: launch app.py locally)")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the launched app.py (default: 5055)")
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0,
+                        help="Artificial latency of the stand-in APIs (default: 50)")
+    parser.add_argument("--max-gap", type=float, default=30.0,
+                        help="Cap on recorded idle gaps in seconds, before speed-up (default: 30)")
+    parser.add_argument("--workers", type=int, default=64, help="Max concurrent in-flight requests (default: 64)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds (default: 30)")
+    args = parser.parse_args(argv)
+
+    if not 1.0 <= args.speed <= 100.0:
+        parser.error("--speed must be between 1 and 100")
+
+    entries = load_recording(args.recording)
+    if not entries:
+        print(f"❌ No updates found in {args.recording}")
+        return 1
+
+    stub, proc = None, None
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        try:
+            target = args.target
+            if not target:
+                stub = start_stub_server(args.stub_latency_ms)
+                stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+                seeded = seed_users_file(os.path.join(workdir, "users.json"), entries)
+                fd, log_path = tempfile.mkstemp(prefix="replay-app-", suffix=".log")
+                os.close(fd)
+                proc = launch_app(args.port, stub_url, workdir, log_path)
+                target = f"http://127.0.0.1:{args.port}"
+                print(f"🚀 Launched app.py on {target} against stand-in APIs at {stub_url} ({seeded} users seeded)")
+                print(f"📄 App log: {log_path}")
+
+            print(f"▶️ Replaying {len(entries)} updates at {args.speed:g}x against {target}")
+            started = time.perf_counter()
+            results, max_lag = replay(entries, target, args.speed, args.max_gap, args.workers, args.timeout)
+            print_report(results, time.perf_counter() - started, max_lag)
+            if stub:
+                print(f"Stand-in API calls: {dict(StubHandler.counts)}")
+        finally:
+            if proc:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            if stub:
+                stub.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
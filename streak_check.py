@@ -1,13 +1,16 @@
 # LeetCode Streak Checker - Core Logic
 import os
+import time
 import random
 import logging
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import json
+from collections import deque
 from typing import Dict, Optional, List
 import requests
 from urllib.parse import urlparse
+from profiling import maybe_profile, collect_spans, span
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,14 +21,23 @@ token = os.getenv("TELEGRAM_TOKEN")
 if not token:
     logger.error("TELEGRAM_TOKEN environment variable is not set!")
     
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{token}"
+# API base URLs can be overridden to point the bot at stand-in servers (see replay.py)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_API_URL = f"{TELEGRAM_API_BASE}/bot{token}"
+LEETCODE_GRAPHQL_URL = os.getenv("LEETCODE_GRAPHQL_URL", "https://leetcode.com/graphql")
 
 # File to store user data persistently
-USERS_FILE = "users.json"
+USERS_FILE = os.getenv("USERS_FILE", "users.json")
 
 # Store processed message IDs to prevent duplicates
 processed_messages = set()
 
+# Summaries of recent check_all_users runs, newest last
+sweep_history = deque(maxlen=20)
+
+# Commands handle_message dispatches on, matched by prefix in this order
+COMMANDS = ("/start", "/help", "/register", "/check")
+
 def load_users() -> Dict[str, str]:
     """Load users from JSON file."""
     try:
@@ -41,7 +53,7 @@ def load_users() -> Dict[str, str]:
 def save_users_to_file() -> None:
     """Save users to JSON file."""
     try:
-        with open(USERS_FILE, 'w') as f:
+        with span("persist"), open(USERS_FILE, 'w') as f:
             json.dump(users, f, indent=2)
         logger.info(f"Saved {len(users)} users to {USERS_FILE}")
     except Exception as e:
@@ -86,7 +98,7 @@ def save_user(chat_id: str, leetcode_username: str) -> None:
 def validate_leetcode_username(username: str) -> bool:
     """Validate if a LeetCode username exists by making a test query."""
     try:
-        url = "https://leetcode.com/graphql"
+        url = LEETCODE_GRAPHQL_URL
         headers = {
             "Content-Type": "application/json",
             "Referer": f"https://leetcode.com/{username}/",
@@ -109,10 +121,12 @@ def validate_leetcode_username(username: str) -> bool:
             "variables": {"username": username}
         }
 
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        with span("fetch"):
+            response = requests.post(url, json=payload, headers=headers, timeout=10)
         if response.status_code == 200:
-            data = response.json()
-            return data.get("data", {}).get("matchedUser") is not None
+            with span("parse"):
+                data = response.json()
+                return data.get("data", {}).get("matchedUser") is not None
         return False
     except Exception as e:
         logger.error(f"Error validating username {username}: {e}")
@@ -121,7 +135,7 @@ def validate_leetcode_username(username: str) -> bool:
 def has_submitted_today(username: str) -> bool:
     """Check if user has submitted any problem today."""
     try:
-        url = "https://leetcode.com/graphql"
+        url = LEETCODE_GRAPHQL_URL
         headers = {
             "Content-Type": "application/json",
             "Referer": f"https://leetcode.com/{username}/",
@@ -144,36 +158,38 @@ def has_submitted_today(username: str) -> bool:
             "variables": {"username": username}
         }
 
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        with span("fetch"):
+            response = requests.post(url, json=payload, headers=headers, timeout=10)
 
         if response.status_code != 200:
             logger.error(f"Failed to fetch data from LeetCode GraphQL for {username}")
             return False
 
-        data = response.json()
-        if "errors" in data:
-            logger.error(f"GraphQL errors for {username}: {data['errors']}")
-            return False
-
-        submissions = data.get("data", {}).get("recentSubmissionList", [])
-        if not submissions:
-            logger.info(f"No recent submissions found for {username}")
+        with span("parse"):
+            data = response.json()
+            if "errors" in data:
+                logger.error(f"GraphQL errors for {username}: {data['errors']}")
+                return False
+
+            submissions = data.get("data", {}).get("recentSubmissionList", [])
+            if not submissions:
+                logger.info(f"No recent submissions found for {username}")
+                return False
+
+            today = datetime.now(ZoneInfo("Asia/Kolkata")).date()
+            logger.info(f"Checking submissions for {username} on {today}")
+
+            for sub in submissions:
+                try:
+                    sub_time = datetime.fromtimestamp(int(sub["timestamp"]), ZoneInfo("Asia/Kolkata")).date()
+                    if sub_time == today:
+                        logger.info(f"Found submission for {username} on {today}: {sub['title']}")
+                        return True
+                except Exception as e:
+                    logger.warning(f"Failed to parse submission timestamp for {username}: {e}")
+
+            logger.info(f"No submissions found for {username} on {today}")
             return False
-
-        today = datetime.now(ZoneInfo("Asia/Kolkata")).date()
-        logger.info(f"Checking submissions for {username} on {today}")
-
-        for sub in submissions:
-            try:
-                sub_time = datetime.fromtimestamp(int(sub["timestamp"]), ZoneInfo("Asia/Kolkata")).date()
-                if sub_time == today:
-                    logger.info(f"Found submission for {username} on {today}: {sub['title']}")
-                    return True
-            except Exception as e:
-                logger.warning(f"Failed to parse submission timestamp for {username}: {e}")
-
-        logger.info(f"No submissions found for {username} on {today}")
-        return False
         
     except Exception as e:
         logger.error(f"Error checking submissions for {username}: {e}")
@@ -182,15 +198,16 @@ def has_submitted_today(username: str) -> bool:
 def send_telegram_message(chat_id: str, message: str) -> bool:
     """Send a message to Telegram chat."""
     try:
-        response = requests.post(
-            f"{TELEGRAM_API_URL}/sendMessage", 
-            data={
-                "chat_id": chat_id, 
-                "text": message,
-                "parse_mode": "HTML"
-            },
-            timeout=10
-        )
+        with span("send"):
+            response = requests.post(
+                f"{TELEGRAM_API_URL}/sendMessage", 
+                data={
+                    "chat_id": chat_id, 
+                    "text": message,
+                    "parse_mode": "HTML"
+                },
+                timeout=10
+            )
         if response.status_code == 200:
             logger.info(f"Message sent successfully to {chat_id}")
             return True
@@ -201,6 +218,10 @@ def send_telegram_message(chat_id: str, message: str) -> bool:
         logger.error(f"Telegram send error for {chat_id}: {e}")
         return False
 
+def match_command(text: str) -> Optional[str]:
+    """Return the command in COMMANDS that text starts with, if any."""
+    return next((command for command in COMMANDS if text.startswith(command)), None)
+
 def handle_message(update: dict) -> None:
     """Handle incoming Telegram messages."""
     try:
@@ -227,8 +248,9 @@ def handle_message(update: dict) -> None:
                 processed_messages.clear()
 
         logger.info(f"Received message from {username} ({chat_id}): {text}")
+        command = match_command(text)
 
-        if text.startswith("/start"):
+        if command == "/start":
             welcome_message = """
 🚀 <b>Welcome to LeetCode Streak Checker Bot!</b> 
 
@@ -248,7 +270,7 @@ Use <code>/register your_leetcode_username</code> to begin tracking your streak!
             send_telegram_message(chat_id, welcome_message)
             return
 
-        if text.startswith("/help"):
+        if command == "/help":
             help_message = """
 <b>LeetCode Streak Checker Bot - Help</b>
 
@@ -266,7 +288,7 @@ Use <code>/register your_leetcode_username</code> to begin tracking your streak!
             send_telegram_message(chat_id, help_message)
             return
 
-        if text.startswith("/register"):
+        if command == "/register":
             parts = text.split()
             if len(parts) != 2:
                 logger.warning(f"Invalid register command from {chat_id}: {text}")
@@ -299,7 +321,7 @@ Use <code>/register your_leetcode_username</code> to begin tracking your streak!
                                 f"🎯 You'll now receive daily streak reminders at 8:00 PM IST!")
             return
 
-        if text.startswith("/check"):
+        if command == "/check":
             leetcode_username = get_user_leetcode(chat_id)
             if not leetcode_username:
                 send_telegram_message(chat_id, "❌ You haven't registered yet!\n"
@@ -325,7 +347,9 @@ Use <code>/register your_leetcode_username</code> to begin tracking your streak!
 def handle_webhook(request_data: dict) -> None:
     """Handle incoming webhook from Telegram."""
     if "message" in request_data:
-        handle_message(request_data)
+        # Profiled only when armed via the /profiling admin endpoint
+        with maybe_profile("message"):
+            handle_message(request_data)
 
 def set_webhook(webhook_url: str) -> bool:
     """Set the webhook URL for the Telegram bot."""
@@ -342,24 +366,46 @@ def set_webhook(webhook_url: str) -> bool:
         logger.error(f"Failed to set webhook: {e}")
         return False
 
-def check_all_users() -> None:
-    """Check submissions for all registered users."""
-    if not users:
-        logger.info("No users registered yet")
-        return
-        
-    logger.info(f"Checking submissions for {len(users)} users")
-    
-    for chat_id, username in users.items():
-        try:
-            logger.info(f"Checking user {username} ({chat_id})")
-            if has_submitted_today(username):
-                send_telegram_message(chat_id, get_random_message(success_messages))
-            else:
-                send_telegram_message(chat_id, get_random_message(warning_messages))
-            logger.info(f"Checked streak for {username} on {datetime.now(ZoneInfo('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M:%S')}")
-        except Exception as e:
-            logger.error(f"Error checking user {username}: {e}")
+def check_all_users() -> dict:
+    """Check submissions for all registered users.
+
+    Returns a sweep summary with counts and per-phase timings (fetch, parse, send, persist)."""
+    summary = {
+        "started_at": datetime.now().isoformat(),
+        "users_checked": 0,
+        "submitted": 0,
+        "reminded": 0,
+        "errors": 0
+    }
+    started = time.perf_counter()
+
+    with maybe_profile("sweep") as profile, collect_spans() as phases:
+        if not users:
+            logger.info("No users registered yet")
+        else:
+            logger.info(f"Checking submissions for {len(users)} users")
+
+        for chat_id, username in list(users.items()):
+            try:
+                logger.info(f"Checking user {username} ({chat_id})")
+                if has_submitted_today(username):
+                    send_telegram_message(chat_id, get_random_message(success_messages))
+                    summary["submitted"] += 1
+                else:
+                    send_telegram_message(chat_id, get_random_message(warning_messages))
+                    summary["reminded"] += 1
+                logger.info(f"Checked streak for {username} on {datetime.now(ZoneInfo('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M:%S')}")
+            except Exception as e:
+                summary["errors"] += 1
+                logger.error(f"Error checking user {username}: {e}")
+            summary["users_checked"] += 1
+
+    summary["duration_seconds"] = round(time.perf_counter() - started, 3)
+    summary["phases_seconds"] = {phase: round(phases.get(phase, 0.0), 3) for phase in ("fetch", "parse", "send", "persist")}
+    summary["profile"] = profile["file"]
+    sweep_history.append(summary)
+    logger.info(f"Sweep summary: {summary}")
+    return summary
 
 if __name__ == "__main__":
     # If running as a script, check all users (for cron job compatibility)
@@ -0,0 +1,355 @@
+# Tests for webhook recording, profiling and admission control
+import os
+import json
+import time
+import threading
+import pytest
+import admission
+import profiling
+import streak_check
+from admission import AdmissionController, TokenBucket, describe_update
+from recorder import anonymize_update, record_update, load_recording
+
+def _ids(value) -> set:
+    """Collect every "id" value anywhere in an update."""
+    if isinstance(value, list):
+        return set().union(*(_ids(item) for item in value)) if value else set()
+    if not isinstance(value, dict):
+        return set()
+    found = {value["id"]} if "id" in value else set()
+    for item in value.values():
+        found |= _ids(item)
+    return found
+
+def _ints(value) -> set:
+    """Collect every integer value anywhere in an update."""
+    if isinstance(value, list):
+        return set().union(*(_ints(item) for item in value)) if value else set()
+    if isinstance(value, dict):
+        return set().union(*(_ints(item) for item in value.values())) if value else set()
+    return {value} if isinstance(value, int) and not isinstance(value, bool) else set()
+
+def test_anonymize_message_chat_and_sender():
+    update = {"update_id": 1, "message": {
+        "message_id": 5, "text": "/check",
+        "chat": {"id": 123, "type": "private", "first_name": "Alice", "username": "alice"},
+        "from": {"id": 123, "is_bot": False, "first_name": "Alice", "last_name": "Smith", "username": "alice"}
+    }}
+    result = anonymize_update(update)
+    message = result["message"]
+    assert message["text"] == "/check"
+    assert message["message_id"] == 5
+    assert message["chat"]["id"] != 123
+    assert message["chat"]["id"] == message["from"]["id"]
+    assert message["chat"]["type"] == "private"
+    dumped = json.dumps(result)
+    for leaked in ("Alice", "Smith", "alice"):
+        assert leaked not in dumped
+    # The input is left untouched
+    assert update["message"]["chat"]["id"] == 123
+
+def test_anonymize_non_message_updates():
+    updates = [
+        {"update_id": 2, "edited_message": {"message_id": 1, "text": "/check",
+                                            "chat": {"id": 123, "first_name": "Alice"},
+                                            "from": {"id": 123, "first_name": "Alice"}}},
+        {"update_id": 3, "channel_post": {"message_id": 1, "text": "hi",
+                                          "chat": {"id": -100123, "title": "Secret Channel"},
+                                          "sender_chat": {"id": -100123, "title": "Secret Channel"}}},
+        {"update_id": 4, "callback_query": {"id": "cb1", "data": "x",
+                                            "from": {"id": 123, "username": "alice", "first_name": "Alice"},
+                                            "message": {"message_id": 9, "chat": {"id": 123, "first_name": "Alice"}}}},
+    ]
+    for update in updates:
+        result = anonymize_update(update)
+        dumped = json.dumps(result)
+        for leaked in ("Alice", "alice", "Secret Channel"):
+            assert leaked not in dumped
+        assert not _ids(result) & {123, -100123}
+
+def test_anonymize_nested_identities():
+    update = {"update_id": 5, "message": {
+        "message_id": 7, "text": "/check",
+        "chat": {"id": -100, "type": "group", "title": "Study Group"},
+        "from": {"id": 1, "username": "carol"},
+        "reply_to_message": {"message_id": 6, "chat": {"id": -100, "title": "Study Group"},
+                             "from": {"id": 2, "username": "bob", "first_name": "Bob"}},
+        "forward_from": {"id": 3, "first_name": "Dave"},
+        "new_chat_members": [{"id": 4, "first_name": "Eve", "username": "eve"}],
+        "contact": {"phone_number": "+100000", "first_name": "Frank"}
+    }}
+    result = anonymize_update(update)
+    dumped = json.dumps(result)
+    for leaked in ("Study Group", "carol", "bob", "Bob", "Dave", "Eve", "eve", "+100000", "Frank"):
+        assert leaked not in dumped
+    assert result["message"]["reply_to_message"]["chat"]["id"] == result["message"]["chat"]["id"]
+    assert not _ids(result) & {-100, 1, 2, 3, 4}
+
+def test_anonymize_forward_origin_and_external_reply():
+    update = {"update_id": 6, "message": {
+        "message_id": 8, "text": "fwd",
+        "chat": {"id": 10, "type": "private"},
+        "forward_origin": {"type": "user", "date": 1,
+                           "sender_user": {"id": 777, "first_name": "Alice", "username": "alice"}},
+        "external_reply": {"origin": {"type": "hidden_user", "date": 1, "sender_user_name": "Hidden Harry"},
+                           "chat": {"id": -200, "title": "Other Group"}}
+    }}
+    result = anonymize_update(update)
+    dumped = json.dumps(result)
+    for leaked in ("Alice", "alice", "Hidden Harry", "Other Group"):
+        assert leaked not in dumped
+    assert not _ids(result) & {10, 777, -200}
+    assert result["message"]["forward_origin"]["type"] == "user"
+
+def test_anonymize_raw_id_fields():
+    updates = [
+        {"update_id": 7, "chat_join_request": {
+            "chat": {"id": -300, "title": "Join Me"}, "from": {"id": 55, "first_name": "Gina"},
+            "user_chat_id": 55, "date": 1, "bio": "I love graphs"}},
+        {"update_id": 8, "message_reaction": {
+            "chat": {"id": -300}, "message_id": 1, "date": 1,
+            "actor_chat": {"id": -400, "title": "Anon Admins"}, "old_reaction": [], "new_reaction": []}},
+        {"update_id": 9, "message": {
+            "message_id": 2, "chat": {"id": -300}, "migrate_to_chat_id": -1000300,
+            "users_shared": {"request_id": 1, "user_ids": [55, 66]},
+            "chat_shared": {"request_id": 2, "chat_id": -500, "title": "Shared Chat"}}},
+    ]
+    raw = {55, 66, -300, -400, -500, -1000300}
+    for update in updates:
+        result = anonymize_update(update)
+        dumped = json.dumps(result)
+        for leaked in ("Join Me", "Gina", "I love graphs", "Anon Admins", "Shared Chat"):
+            assert leaked not in dumped
+        assert not _ints(result) & raw
+    join = anonymize_update(updates[0])["chat_join_request"]
+    assert join["user_chat_id"] == join["from"]["id"]
+
+def test_load_recording_skips_non_object_updates(tmp_path):
+    path = tmp_path / "updates.jsonl"
+    path.write_text('{"t":1,"u":[1,2]}\n{"t":2,"u":"x"}\nnot json\n{"t":3,"u":{"update_id":1}}\n')
+    assert load_recording(str(path)) == [(3.0, {"update_id": 1})]
+
+def test_record_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "updates.jsonl")
+    update = {"update_id": 1, "message": {"message_id": 1, "text": "/help", "chat": {"id": 42}}}
+    record_update(update, path)
+    record_update(update, path)
+    entries = load_recording(path)
+    assert len(entries) == 2
+    assert entries[0][1]["message"]["text"] == "/help"
+    assert entries[0][1]["message"]["chat"]["id"] != 42
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+def _controller(**limits) -> AdmissionController:
+    settings = dict(global_rate=100, global_burst=100, chat_rate=100, chat_burst=100,
+                    max_in_flight=100, max_in_flight_per_chat=100)
+    settings.update(limits)
+    return AdmissionController(**settings)
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=3)
+    bucket.updated = 0.0
+    bucket.tokens = 0
+    assert bucket.refill(1.0) == 2
+    assert bucket.refill(10.0) == 3
+
+def test_repeated_check_is_coalesced_until_release(clock):
+    controller = _controller()
+    assert controller.try_admit("1", "/check") is None
+    assert controller.try_admit("1", "/check") == "coalesced"
+    # Other chats and other commands are not affected
+    assert controller.try_admit("2", "/check") is None
+    assert controller.try_admit("1", "/help") is None
+    controller.release("1", "/check")
+    assert controller.try_admit("1", "/check") is None
+    assert controller.stats()["shed"] == {"coalesced": 1}
+
+def test_in_flight_limits(clock):
+    controller = _controller(max_in_flight=2, max_in_flight_per_chat=1)
+    assert controller.try_admit("1", "/help") is None
+    assert controller.try_admit("1", "/start") == "chat_in_flight"
+    assert controller.try_admit("2", "/help") is None
+    assert controller.try_admit("3", "/help") == "global_in_flight"
+    controller.release("2", "/help")
+    assert controller.try_admit("3", "/help") is None
+
+def test_rate_limits_and_refill(clock):
+    controller = _controller(chat_rate=1, chat_burst=2, global_rate=1, global_burst=3)
+    assert controller.try_admit("1", "/help") is None
+    assert controller.try_admit("1", "/help") is None
+    assert controller.try_admit("1", "/help") == "chat_rate"
+    assert controller.try_admit("2", "/help") is None
+    assert controller.try_admit("3", "/help") == "global_rate"
+    clock[0] += 1.0
+    assert controller.try_admit("1", "/help") is None
+    stats = controller.stats()
+    assert stats["shed"] == {"chat_rate": 1, "global_rate": 1}
+    assert stats["admitted"] == 4
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    # Keep app import from starting the scheduler thread or writing bot.log into the repo
+    monkeypatch.setenv("WERKZEUG_RUN_MAIN", "true")
+    monkeypatch.chdir(tmp_path)
+    import app
+    monkeypatch.setattr(app, "record_update", lambda update: None)
+    monkeypatch.setattr(admission, "controller", _controller(chat_rate=0.001, chat_burst=2, max_in_flight_per_chat=2))
+    return app, app.app.test_client()
+
+def _update(update_id: int, text: str, chat_id: int = 5) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": text}}
+
+def test_webhook_releases_admission_after_handler_exception(client, monkeypatch):
+    app, test_client = client
+
+    def failing_handler(update):
+        raise RuntimeError("LeetCode down")
+
+    monkeypatch.setattr(app, "handle_webhook", failing_handler)
+    response = test_client.post("/webhook", json=_update(1, "/check"))
+    assert response.status_code == 500
+    stats = admission.controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["pending_checks"] == 0
+
+def test_webhook_sheds_bursts_without_handling(client, monkeypatch):
+    app, test_client = client
+    started, finish = threading.Event(), threading.Event()
+    handled = []
+
+    def blocking_handler(update):
+        handled.append(update["update_id"])
+        if update["update_id"] == 1:
+            started.set()
+            finish.wait(5)
+
+    monkeypatch.setattr(app, "handle_webhook", blocking_handler)
+    first = {}
+    worker = threading.Thread(target=lambda: first.update(response=test_client.post("/webhook", json=_update(1, "/check"))))
+    worker.start()
+    assert started.wait(5)
+
+    # Repeated /check while the first is pending is coalesced, then the chat's bucket runs dry
+    responses = [test_client.post("/webhook", json=_update(i, text)) for i, text in
+                 ((2, "/check"), (3, "/checkx"), (4, "/help"), (5, "/start"))]
+    finish.set()
+    worker.join(5)
+
+    assert first["response"].status_code == 200
+    assert first["response"].get_json() == {"status": "success"}
+    assert [r.status_code for r in responses] == [200, 200, 200, 200]
+    assert [r.get_json() for r in responses] == [
+        {"status": "shed", "reason": "coalesced"},
+        {"status": "shed", "reason": "coalesced"},
+        {"status": "success"},
+        {"status": "shed", "reason": "chat_rate"},
+    ]
+    assert handled == [1, 4]
+    stats = admission.controller.stats()
+    assert stats["in_flight"] == 0
+    assert stats["shed"] == {"coalesced": 2, "chat_rate": 1}
+
+def test_webhook_malformed_message_is_not_a_server_error(client, monkeypatch):
+    app, test_client = client
+    monkeypatch.setattr(app, "handle_webhook", lambda update: None)
+    for message in ({"chat": "x", "text": "/check"}, {"chat": {"id": 5}, "text": 42}, {"chat": None, "text": None}):
+        response = test_client.post("/webhook", json={"update_id": 1, "message": message})
+        assert response.status_code == 200
+    assert admission.controller.stats()["in_flight"] == 0
+
+def test_describe_update_matches_handle_message_prefixes():
+    def update(text, chat_id=5):
+        return {"message": {"chat": {"id": chat_id}, "text": text}}
+    assert describe_update(update("/check")) == ("5", "/check")
+    assert describe_update(update("/check@streak_bot")) == ("5", "/check")
+    assert describe_update(update("/checkx")) == ("5", "/check")
+    assert describe_update(update("/register bob")) == ("5", "/register")
+    assert describe_update(update("/unknown arg")) == ("5", "/unknown")
+    assert describe_update(update("hello")) == ("5", None)
+    assert describe_update({"edited_message": {"chat": {"id": 5}, "text": "/check"}}) == (None, None)
+    assert describe_update({"message": {"chat": "x", "text": "/check"}}) == (None, "/check")
+    assert describe_update({"message": {"chat": {"id": 5}, "text": 42}}) == ("5", None)
+
+def test_arm_bounds_and_unknown_target(monkeypatch):
+    monkeypatch.setattr(profiling, "_armed", {"sweep": 0, "message": 0})
+    with pytest.raises(ValueError):
+        profiling.arm("nightly", 1)
+    with pytest.raises(ValueError):
+        profiling.arm("sweep", -1)
+    with pytest.raises(ValueError):
+        profiling.arm("sweep", profiling.MAX_PROFILE_COUNT + 1)
+    assert profiling.arm("sweep", 2) == 2
+    assert profiling.armed() == {"sweep": 2, "message": 0}
+
+def test_maybe_profile_consumes_armed_runs(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "_armed", {"sweep": 0, "message": 0})
+    profiling.arm("message", 1)
+    with profiling.maybe_profile("message") as info:
+        sum(range(1000))
+    assert info["file"] and info["file"].endswith(".prof")
+    assert (tmp_path / info["file"]).exists()
+    assert profiling.armed()["message"] == 0
+    with profiling.maybe_profile("message") as info:
+        pass
+    assert info["file"] is None
+    assert [p["name"] for p in profiling.list_profiles()] == [f.name for f in tmp_path.iterdir()]
+
+def test_list_profiles_skips_files_removed_concurrently(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    (tmp_path / "sweep-a.prof").write_bytes(b"x")
+    (tmp_path / "sweep-b.prof").write_bytes(b"x")
+    real_stat = os.stat
+
+    def racing_stat(path, *args, **kwargs):
+        if str(path).endswith("sweep-a.prof"):
+            raise FileNotFoundError(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(profiling.os, "stat", racing_stat)
+    assert [p["name"] for p in profiling.list_profiles()] == ["sweep-b.prof"]
+
+def test_spans_accumulate_per_thread():
+    with profiling.span("fetch"):
+        pass  # No collector active: nothing recorded, nothing raised
+
+    other_thread_phases = {}
+
+    def other_thread():
+        with profiling.span("send"):
+            pass
+        with profiling.collect_spans() as phases:
+            with profiling.span("persist"):
+                pass
+        other_thread_phases.update(phases)
+
+    with profiling.collect_spans() as phases:
+        with profiling.span("fetch"):
+            time.sleep(0.01)
+        with profiling.span("fetch"):
+            time.sleep(0.01)
+        worker = threading.Thread(target=other_thread)
+        worker.start()
+        worker.join()
+    assert set(phases) == {"fetch"}
+    assert phases["fetch"] >= 0.02
+    assert set(other_thread_phases) == {"persist"}
+
+def test_check_all_users_returns_phase_summary(monkeypatch):
+    monkeypatch.setattr(streak_check, "users", {"1": "alice", "2": "bob"})
+    monkeypatch.setattr(streak_check, "has_submitted_today", lambda username: username == "alice")
+    sent = []
+    monkeypatch.setattr(streak_check, "send_telegram_message", lambda chat_id, message: sent.append(chat_id) or True)
+    before = len(streak_check.sweep_history)
+    summary = streak_check.check_all_users()
+    assert set(summary["phases_seconds"]) == {"fetch", "parse", "send", "persist"}
+    assert summary["users_checked"] == 2
+    assert summary["submitted"] == 1 and summary["reminded"] == 1
+    assert sent == ["1", "2"]
+    assert streak_check.sweep_history[-1] is summary
+    assert len(streak_check.sweep_history) == min(before + 1, streak_check.sweep_history.maxlen)